@@ -30,6 +30,16 @@ from . import mail
 
 
 NIGHTLY_PAT = Bugzilla.get_landing_patterns(channels=['nightly'])
+# all the landing patterns in one regex: each alternative has only one group
+# and the hint is used to skip the comments without any landing
+LANDING_HINT = 'mozilla-central'
+for p, _ in NIGHTLY_PAT:
+    assert p.groups == 1, 'Landing pattern {} must have one group'.format(p.pattern)
+    assert LANDING_HINT in p.pattern, 'Landing pattern {} must contain {}'.format(p.pattern, LANDING_HINT)
+LANDING_PAT = re.compile('|'.join('(?:{})'.format(p.pattern) for p, _ in NIGHTLY_PAT))
+# only the comments posted in the days before the fix are retrieved
+COMMENT_WINDOW = 7
+COMMENT_CHUNK_SIZE = 100
 PAR_PAT = re.compile('\([^\)]*\)')
 BRA_PAT = re.compile('\[[^\]]*\]')
 DIA_PAT = re.compile('<[^>]*>')
@@ -145,12 +155,22 @@ def bug_handler(bug, data):
     del bug['cf_qa_whiteboard']
 
 
+def get_landing_revisions(comments):
+    revisions = []
+    for comment in comments:
+        text = comment['text']
+        if LANDING_HINT not in text:
+            continue
+        for m in LANDING_PAT.finditer(text):
+            revisions.append(m.group(m.lastindex))
+    return revisions
+
+
 def comment_handler(invalids, bug, bugid, data):
-    r = Bugzilla.get_landing_comments(bug['comments'], [], NIGHTLY_PAT)
+    r = get_landing_revisions(bug['comments'])
     if r:
         d = {}
-        for i in r:
-            revision = i['revision']
+        for revision in r:
             d[revision] = {'date': None, 'backedout': False, 'bugid': bugid}
 
         data[int(bugid)]['land'] = d
@@ -180,6 +200,34 @@ def history_handler(flag, date, invalids, history, data):
         invalids.add(bugid)
 
 
+def get_comments(bugids, date, invalids, data):
+    # get the comments posted since a few days before the fix date
+    new_since = date - relativedelta(days=COMMENT_WINDOW)
+    new_since = new_since.strftime('%Y-%m-%dT%H:%M:%SZ')
+    bugids = [str(bugid) for bugid in bugids]
+    queries = []
+
+    def handler(json, data):
+        for bugid, bug in json['bugs'].items():
+            comment_handler(invalids, bug, bugid, data)
+
+    for i in range(0, len(bugids), COMMENT_CHUNK_SIZE):
+        chunk = bugids[i:(i + COMMENT_CHUNK_SIZE)]
+        url = Bugzilla.API_URL + '/' + chunk[0] + '/comment'
+        params = {'ids': chunk[1:],
+                  'new_since': new_since,
+                  'include_fields': ['text']}
+        queries.append(Query(url, params, handler, data))
+
+    if queries:
+        Bugzilla(queries=queries).wait()
+
+    # bugs without any comment in the window are not in the response
+    for bugid in bugids:
+        if not data[int(bugid)]['land']:
+            invalids.add(int(bugid))
+
+
 def patch_analysis(patch):
     info = PATCH_INFO.copy()
 
@@ -383,11 +431,12 @@ def get_bugs(date, major, date_range):
         bugids = list(data.keys())
         invalids = set()
         Bugzilla(bugids=bugids,
-                 commenthandler=functools.partial(comment_handler, invalids),
-                 commentdata=data,
                  historyhandler=functools.partial(history_handler, flag, date, invalids),
-                 historydata=data,
-                 comment_include_fields=['text']).get_data().wait()
+                 historydata=data).get_data().wait()
+
+        # no need to get the comments for the bugs which weren't fixed this day
+        bugids = [bugid for bugid in bugids if bugid not in invalids]
+        get_comments(bugids, date, invalids, data)
 
         for invalid in invalids:
             del data[invalid]
@@ -22,52 +22,63 @@ import tempfile
 
 from pprint import pprint
 
-def get_bz_params(v):
+def get_bz_params(versions):
     # status_57: (fixed or verified)->affected OR (status_57 == (fixed or verified) AND bug_status == REOPENED)
-    status = 'cf_status_firefox{}'.format(v)
-    tracking = 'cf_tracking_firefox{}'.format(v)
-    fields = ['id', 'status', 'resolution', 'summary', status, tracking]
+    # when several versions are given, the charts for each of them are OR'ed
+    # in order to get all the candidates with a single search
+    fields = ['id', 'status', 'resolution', 'summary']
+    for v in versions:
+        fields += ['cf_status_firefox{}'.format(v), 'cf_tracking_firefox{}'.format(v)]
     params = {'include_fields': fields,
-              'j_top': 'OR',
-              'f1': 'OP',
-              'f2': 'OP',
-              'j2': 'OR',
-              'f3': status,
-              'o3': 'changedfrom',
-              'v3': 'fixed',
-              'f4': status,
-              'o4': 'changedfrom',
-              'v4': 'verified',
-              'f5': 'CP',
-              'f6': status,
-              'o6': 'changedto',
-              'v6': 'affected',
-              'f7': 'CP',
-              'f8': 'OP',
-              'f9': 'OP',
-              'j9': 'OR',
-              'f10': status,
-              'o10': 'equals',
-              'v10': 'fixed',
-              'f11': status,
-              'o11': 'equals',
-              'v11': 'verified',
-              'f12': 'CP',
-              'f13': 'bug_status',
-              'o13': 'equals',
-              'v13': 'REOPENED',
-              'f14': 'CP'}
+              'j_top': 'OR'}
+    for i, v in enumerate(versions):
+        status = 'cf_status_firefox{}'.format(v)
+        n = 14 * i
+        params.update({'f{}'.format(n + 1): 'OP',
+                       'f{}'.format(n + 2): 'OP',
+                       'j{}'.format(n + 2): 'OR',
+                       'f{}'.format(n + 3): status,
+                       'o{}'.format(n + 3): 'changedfrom',
+                       'v{}'.format(n + 3): 'fixed',
+                       'f{}'.format(n + 4): status,
+                       'o{}'.format(n + 4): 'changedfrom',
+                       'v{}'.format(n + 4): 'verified',
+                       'f{}'.format(n + 5): 'CP',
+                       'f{}'.format(n + 6): status,
+                       'o{}'.format(n + 6): 'changedto',
+                       'v{}'.format(n + 6): 'affected',
+                       'f{}'.format(n + 7): 'CP',
+                       'f{}'.format(n + 8): 'OP',
+                       'f{}'.format(n + 9): 'OP',
+                       'j{}'.format(n + 9): 'OR',
+                       'f{}'.format(n + 10): status,
+                       'o{}'.format(n + 10): 'equals',
+                       'v{}'.format(n + 10): 'fixed',
+                       'f{}'.format(n + 11): status,
+                       'o{}'.format(n + 11): 'equals',
+                       'v{}'.format(n + 11): 'verified',
+                       'f{}'.format(n + 12): 'CP',
+                       'f{}'.format(n + 13): 'bug_status',
+                       'o{}'.format(n + 13): 'equals',
+                       'v{}'.format(n + 13): 'REOPENED',
+                       'f{}'.format(n + 14): 'CP'})
 
     return params
 
 
-def get_major(channel):
-    allversions = ProductVersions.get_all_versions()
+def get_major(channel, allversions=None):
+    if allversions is None:
+        allversions = ProductVersions.get_all_versions()
     allversions = allversions[channel]
     major = max(allversions.keys())
     return major
 
 
+def get_majors(channels):
+    allversions = ProductVersions.get_all_versions()
+    return [get_major(channel, allversions=allversions) for channel in channels]
+
+
 def history_handler(date, flag, history, data):
     bugid = int(history['id'])
     history = history['history']
@@ -85,6 +96,29 @@ def history_handler(date, flag, history, data):
                 data[bugid] = True
 
 
+def candidate_handler(flag, history, data):
+    # same as the changedfrom/changedto part of the search query for this flag
+    bugid = int(history['id'])
+    changedfrom = changedto = False
+    for changes in history['history']:
+        for change in changes['changes']:
+            if change['field_name'] != flag:
+                continue
+            if change['removed'] in ['verified', 'fixed']:
+                changedfrom = True
+            if change['added'] == 'affected':
+                changedto = True
+    if changedfrom and changedto:
+        data.add(bugid)
+
+
+def histories_handler(date, flags, history, data):
+    # a bug history is downloaded once and used for all the flags
+    for flag in flags:
+        history_handler(date, flag, history, data['regressions'][flag])
+        candidate_handler(flag, history, data['candidates'][flag])
+
+
 def filter_bugs(data, hdata, status_flag, tracking_flag):
     for bugid, reg in hdata.items():
         if not reg:
@@ -112,39 +146,75 @@ def check_bugs(bugids, treated):
     return bugids
 
                 
-def get_links(major, date='today', treated=''):
+def get_treated_bugs(treated):
+    # just read the treated bugs: check_bugs is in charge of updating the file
+    if treated and os.path.isfile(treated):
+        with open(treated, 'r') as In:
+            return set(json.load(In)['treated'])
+    return set()
+
+
+def get_treated(treated, major):
+    if treated and '{}' in treated:
+        return treated.format(major)
+    return treated
+
+
+def get_all_links(majors, date='today', treated=''):
     TIMEOUT = 240 # the search query can be long to evaluate
-    tracking_flag = 'cf_tracking_firefox{}'.format(major)
-    status_flag = 'cf_status_firefox{}'.format(major)
+    majors = sorted(set(majors))
+    if treated and len(majors) > 1 and '{}' not in treated:
+        raise ValueError('The treated file must contain {} to have one file per version')
+    status_flags = {major: 'cf_status_firefox{}'.format(major) for major in majors}
     date = utils.get_date_ymd(date) if date is not None else date
 
     def bug_handler(bug, data):
         data[bug['id']] = bug
 
     data = {}
-    Bugzilla(get_bz_params(major),
+    Bugzilla(get_bz_params(majors),
              bughandler=bug_handler,
              bugdata=data,
              timeout=TIMEOUT).get_data().wait()
 
-    bugids = list(data.keys())
-    bugids = check_bugs(bugids, treated)
-    hdata = {}
-    Bugzilla(bugids=bugids,
-             historyhandler=functools.partial(history_handler, date, status_flag),
+    # no need to get the history of the bugs already treated for all the versions
+    bugids = set(data.keys())
+    if treated:
+        treated_bugs = [get_treated_bugs(get_treated(treated, major)) for major in majors]
+        bugids -= set.intersection(*treated_bugs)
+
+    flags = list(status_flags.values())
+    hdata = {'regressions': {flag: {} for flag in flags},
+             'candidates': {flag: set() for flag in flags}}
+    Bugzilla(bugids=list(bugids),
+             historyhandler=functools.partial(histories_handler, date, flags),
              historydata=hdata).get_data().wait()
 
-    filter_bugs(data, hdata, status_flag, tracking_flag)
+    res = {}
+    for major in majors:
+        status_flag = status_flags[major]
+        tracking_flag = 'cf_tracking_firefox{}'.format(major)
+        candidates = hdata['candidates'][status_flag]
+        for bugid, bug in data.items():
+            if bug['status'] == 'REOPENED' and bug.get(status_flag) in ['verified', 'fixed']:
+                candidates.add(bugid)
 
-    links = [(bugid, Bugzilla.get_links(bugid)) for bugid, reg in hdata.items() if reg]
-    links = sorted(links, key=lambda p: p[0])
-    
-    return links
+        bugids = check_bugs(list(candidates), get_treated(treated, major))
+        regressions = hdata['regressions'][status_flag]
+        regressions = {bugid: regressions[bugid] for bugid in bugids if bugid in regressions}
+        filter_bugs(data, regressions, status_flag, tracking_flag)
 
+        links = [(bugid, Bugzilla.get_links(bugid)) for bugid, reg in regressions.items() if reg]
+        res[major] = sorted(links, key=lambda p: p[0])
 
-def send_email(emails=[], treated='', channel='nightly', version=None, date='today'):
-    major = get_major(channel) if not version else int(version)
-    links = get_links(major, date=None, treated=treated)
+    return res
+
+
+def get_links(major, date='today', treated=''):
+    return get_all_links([major], date=date, treated=treated)[major]
+
+
+def send_report(emails, channel, major, links, date):
     if links:
         #date = utils.get_date(date)
         env = Environment(loader=FileSystemLoader('templates'))
@@ -164,17 +234,49 @@ def send_email(emails=[], treated='', channel='nightly', version=None, date='tod
             print('Body:')
             print(body)
     else:
-        print('No data for {}'.format(date))
+        print('No data for {} {} ({})'.format(channel, major, date))
+
+
+def send_emails(emails=[], treated='', channels=[], versions=[], date='today'):
+    if versions:
+        # the channels are just used as labels for the reports
+        majors = [int(v) for v in versions]
+        if not channels:
+            channels = ['Firefox'] * len(majors)
+        elif len(channels) != len(majors):
+            raise ValueError('There must be one channel per version')
+    else:
+        channels = channels or ['nightly']
+        majors = get_majors(channels)
+
+    reports = []
+    for report in zip(channels, majors):
+        if report not in reports:
+            reports.append(report)
+
+    links = get_all_links(majors, date=None, treated=treated)
+    for channel, major in reports:
+        send_report(emails, channel, major, links[major], date)
+
+
+def send_email(emails=[], treated='', channel='nightly', version=None, date='today'):
+    versions = [version] if version else []
+    send_emails(emails=emails, treated=treated, channels=[channel], versions=versions, date=date)
 
 
 if __name__ == '__main__':
-    description = 'Get reopened bugs for a channel'
+    description = 'Get reopened bugs for one or several channels'
     parser = argparse.ArgumentParser(description=description)
-    parser.add_argument('-c', '--channel', dest='channel', default='nightly')
-    parser.add_argument('-v', '--version', dest='version', default=None)
-    parser.add_argument('-t', '--treated', dest='treated', default='')
+    parser.add_argument('-c', '--channel', dest='channels',
+                        action='store', nargs='+',
+                        default=[], help='channels (default: nightly)')
+    parser.add_argument('-v', '--version', dest='versions',
+                        action='store', nargs='+',
+                        default=[], help='versions')
+    parser.add_argument('-t', '--treated', dest='treated', default='',
+                        help='file with the treated bugs, a {} is replaced by the version')
     parser.add_argument('-e', '--email', dest='emails',
                         action='store', nargs='+',
                         default=[], help='emails')
     args = parser.parse_args()
-    send_email(emails=args.emails, treated=args.treated, channel=args.channel, version=args.version)
+    send_emails(emails=args.emails, treated=args.treated, channels=args.channels, versions=args.versions)